@@ -1,9 +1,59 @@
 import streamlit as st
 import pandas as pd
+import asyncio
+import io
 import json
+import orjson
+import re
 from datetime import date
 from src.engine import generate_roadmap_rows
-from src.ai_helper import generate_task_json, generate_task_checklist
+from src.ai_helper import generate_task_json, generate_task_checklist, generate_task_checklists_async
+
+
+@st.cache_data(show_spinner=False)
+def _cached_rows(templates_json: bytes, ev: str, ds: str, clamp: bool):
+    # 參數全部是 bytes/字串/bool，相同輸入直接從 cache 拿結果
+    return generate_roadmap_rows(
+        orjson.loads(templates_json),
+        date.fromisoformat(ev),
+        date.fromisoformat(ds),
+        clamp=clamp,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def _read_prev_csv(data: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(data))
+
+
+STATUS_OPTIONS = ["Not Started", "In Progress", "Done"]
+
+
+def _to_editor_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Arrow-friendly dtypes, so st.data_editor can serialize each rerun without
+    converting every object-dtype string cell.
+    """
+    # default_status 可能有 "Milestone" 等選項外的值，也要放進 categories
+    statuses = STATUS_OPTIONS + sorted(set(df["Status"].dropna()) - set(STATUS_OPTIONS))
+    return df.astype({
+        "Task": "string[pyarrow]",
+        # 不用 category：data_editor 會把 category 變成只能選既有值的 selectbox，
+        # Project 要維持可以自由輸入（改名、移到新的 project）
+        "Project": "string[pyarrow]",
+        "Status": pd.CategoricalDtype(statuses),
+    }).assign(**{
+        "Start Date": pd.to_datetime(df["Start Date"], format="%Y-%m-%d"),
+        "End Date": pd.to_datetime(df["End Date"], format="%Y-%m-%d"),
+    })
+
+
+SORT_COLUMNS = {
+    "Start Date": ["Start Date", "Project", "Task"],
+    "Project + Start Date": ["Project", "Start Date", "Task"],
+    "Task": ["Task", "Project", "Start Date"],
+}
+
 
 if "roadmap_df" not in st.session_state:
     st.session_state["roadmap_df"] = None  # 儲存最新可用的 roadmap dataframe
@@ -52,24 +102,39 @@ clamp = st.sidebar.checkbox(
     value=True
 )
 
+def _reject_json_constant(name: str):
+    raise ValueError(f"{name} is not allowed in task.json")
+
+
+# 上傳的 task.json 用標準 json 解析（會處理 UTF-8 BOM，orjson 不接受）
+# NaN / Infinity 直接擋掉：後面 orjson.dumps 會把它們變成 null
+templates_ok = False
+if uploaded_file is not None:
+    try:
+        st.session_state["task_templates"] = json.loads(
+            uploaded_file.getvalue(), parse_constant=_reject_json_constant
+        )
+        templates_ok = True
+    except ValueError as e:
+        st.session_state["task_templates"] = None
+        st.sidebar.error(f"Failed to read task template: {e}")
+
 # Main area
-if uploaded_file and event_date and director_start_date:
-    st.session_state["task_templates"] = json.load(uploaded_file)
+if templates_ok and event_date and director_start_date:
 
     # 方便後面使用
     task_templates = st.session_state["task_templates"]
 
 
     if st.button("Generate Roadmap"):
-        rows = generate_roadmap_rows(
-            task_templates,
-            event_date,
-            director_start_date,
-            clamp=clamp
+        rows = _cached_rows(
+            orjson.dumps(task_templates, option=orjson.OPT_SORT_KEYS),
+            event_date.isoformat(),
+            director_start_date.isoformat(),
+            clamp,
         )
 
         df = pd.DataFrame(rows)
-        st.session_state["roadmap_df"] = df.copy()
         st.session_state["has_roadmap"] = True  
         # Keep Status from previous roadmap
         # ---- Step 4: Keep Status from previous roadmap ----
@@ -77,7 +142,7 @@ if uploaded_file and event_date and director_start_date:
 
         if prev_csv is not None:
             try:
-                prev_df = pd.read_csv(prev_csv)
+                prev_df = _read_prev_csv(prev_csv.getvalue())
             except Exception as e:
                 st.sidebar.error(f"Failed to read previous CSV: {e}")
                 prev_df = None  
@@ -86,27 +151,33 @@ if uploaded_file and event_date and director_start_date:
             required_cols = {"Task", "Project", "Status"}
 
             if required_cols.issubset(set(prev_df.columns)):
-                status_map = (
-                    prev_df.dropna(subset=["Task", "Project", "Status"])
-                        .set_index(["Task", "Project"])["Status"]
-                        .to_dict()
-                )
-
-                df["Status"] = df.apply(
-                    lambda row: status_map.get((row["Task"], row["Project"]), row["Status"]),
-                    axis=1
-                )
+                prev = prev_df[["Task", "Project", "Status"]].dropna()
+                status_map = {
+                    (t, p): s
+                    for t, p, s in zip(
+                        prev["Task"].to_numpy().tolist(),
+                        prev["Project"].to_numpy().tolist(),
+                        prev["Status"].to_numpy().tolist(),
+                    )
+                }
+
+                # 一次用 (Task, Project) MultiIndex 查表，找不到的保留原本 Status
+                keys = pd.MultiIndex.from_arrays([df["Task"], df["Project"]])
+                prev_status = pd.Series(status_map, dtype=object).reindex(keys).to_numpy()
+                df["Status"] = pd.Series(prev_status, index=df.index).fillna(df["Status"])
                 st.sidebar.success("Loaded previous Status ✔")
             else:
                 st.sidebar.warning(
                     "Previous CSV missing required columns (Task, Project, Status). Skipped."
                 )
         # 按 Generate Roadmap 時，把「生成好的 df」存起來
-        st.session_state["roadmap_df"] = df.copy()
+        # df 是這次新建的，不需要再 copy
+        st.session_state["roadmap_df"] = _to_editor_dtypes(df)
 
     
     if st.session_state["has_roadmap"] and st.session_state["roadmap_df"] is not None:
-        df = st.session_state["roadmap_df"].copy()
+        # 下面只讀不改（filter/sort 都回傳新的 DataFrame），直接用 reference
+        df = st.session_state["roadmap_df"]
         
         st.subheader("Roadmap Preview")
 
@@ -118,20 +189,13 @@ if uploaded_file and event_date and director_start_date:
             default=all_projects,
         )
 
-        df_view = df[df["Project"].isin(selected_projects)].copy()
-        
         #Sort
         sort_option = st.selectbox(
             "Sort by",
-            ["Start Date", "Project + Start Date", "Task"],
+            list(SORT_COLUMNS),
         )
 
-        if sort_option == "Start Date":
-            df_view = df_view.sort_values(["Start Date", "Project", "Task"])
-        elif sort_option == "Project + Start Date":
-            df_view = df_view.sort_values(["Project", "Start Date", "Task"])
-        else:
-            df_view = df_view.sort_values(["Task", "Project", "Start Date"])
+        df_view = df[df["Project"].isin(selected_projects)].sort_values(SORT_COLUMNS[sort_option])
 
         #Editable Status
         edited_df = st.data_editor(
@@ -139,9 +203,11 @@ if uploaded_file and event_date and director_start_date:
             column_config={
             "Status": st.column_config.SelectboxColumn(
             "Status",
-            options=["Not Started", "In Progress", "Done"],
+            options=STATUS_OPTIONS,
             required=True,
-                )   
+                ),
+            "Start Date": st.column_config.DateColumn("Start Date", format="YYYY-MM-DD"),
+            "End Date": st.column_config.DateColumn("End Date", format="YYYY-MM-DD"),
             },
             use_container_width=True,
             hide_index=True,
@@ -151,7 +217,10 @@ if uploaded_file and event_date and director_start_date:
         st.session_state["roadmap_df"] = edited_df
         st.session_state["has_roadmap"] = True
 
-        csv_bytes = edited_df.to_csv(index=False).encode("utf-8")
+        # 直接寫成 bytes，省掉 str -> encode 的那次複製
+        csv_buf = io.BytesIO()
+        edited_df.to_csv(csv_buf, index=False, lineterminator="\n")
+        csv_bytes = csv_buf.getvalue()
         
         st.download_button(
             "Download CSV",
@@ -165,6 +234,9 @@ if uploaded_file and event_date and director_start_date:
         st.subheader("🤖 AI Helper: Checklist for a Task")
 
         df_for_ai = edited_df.copy()
+        # prompt / cache key 用 ISO 日期字串
+        for col in ("Start Date", "End Date"):
+            df_for_ai[col] = df_for_ai[col].dt.strftime("%Y-%m-%d")
 
         df_for_ai["__key"] = df_for_ai["Task"].astype(str) + " | " + df_for_ai["Project"].astype(str)
         options = df_for_ai["__key"].tolist()
@@ -183,7 +255,13 @@ if uploaded_file and event_date and director_start_date:
             st.write(f"**Status:** {selected_row['Status']}")
             st.write(f"**Dates:** {selected_row['Start Date']} → {selected_row['End Date']}")
 
-            if st.button("Generate Checklist", key="btn_checklist"):
+            generate_clicked = st.button("Generate Checklist", key="btn_checklist")
+            # 已經有結果時可以跳過 cache 重新產生
+            regenerate_clicked = cache_key in st.session_state["ai_checklists"] and st.button(
+                "Regenerate Checklist", key="btn_checklist_regen"
+            )
+
+            if generate_clicked or regenerate_clicked:
                 with st.spinner("Generating checklist..."):
                     try:
                         result = generate_task_checklist(
@@ -193,12 +271,47 @@ if uploaded_file and event_date and director_start_date:
                             end_date=str(selected_row["End Date"]),
                             status=str(selected_row["Status"]),
                             context_projects=sorted(df_for_ai["Project"].unique().tolist()),
+                            use_cache=not regenerate_clicked,
                         )
                         st.session_state["ai_checklists"][cache_key] = result
                         st.success("Generated ✅")
                     except Exception as e:
                         st.error(f"Checklist generation failed: {e}")
 
+            # 一次幫畫面上所有 task 產 checklist（並行送出，不用一個一個等）
+            if st.button("Generate checklists for all visible tasks", key="btn_checklist_all"):
+                with st.spinner(f"Generating {len(df_for_ai)} checklists..."):
+                    # 只算一次，所有 request 共用
+                    context_projects = sorted(df_for_ai["Project"].unique().tolist())
+                    records = df_for_ai.to_dict(orient="records")
+                    results = asyncio.run(generate_task_checklists_async([
+                        dict(
+                            task_name=str(r["Task"]),
+                            project=str(r["Project"]),
+                            start_date=str(r["Start Date"]),
+                            end_date=str(r["End Date"]),
+                            status=str(r["Status"]),
+                            context_projects=context_projects,
+                        )
+                        for r in records
+                    ]))
+
+                    errors = []
+                    for r, result in zip(records, results):
+                        if isinstance(result, Exception):
+                            errors.append(result)
+                            continue
+                        key = r["__key"] + f"::{r['Start Date']}::{r['End Date']}"
+                        st.session_state["ai_checklists"][key] = result
+
+                    if errors:
+                        st.warning(
+                            f"Generated {len(records) - len(errors)}, failed {len(errors)}. "
+                            f"First error: {errors[0]}"
+                        )
+                    else:
+                        st.success("Generated ✅")
+
         with colB:
             st.write("## AI Output")
 
@@ -220,20 +333,31 @@ if uploaded_file and event_date and director_start_date:
 else:
     st.info("Please upload a task template and select dates.")
 
+TASK_ID_RE = re.compile(r"T(\d+)")
+
 def compute_next_task_id(task_templates: list[dict]) -> str:
-    nums = []
-    for t in task_templates:
-        tid = t.get("task_id")
-        if isinstance(tid, str) and tid.startswith("T") and tid[1:].isdigit():
-            nums.append(int(tid[1:]))
-    nxt = (max(nums) + 1) if nums else 1
+    nxt = max(
+        (
+            int(m.group(1))
+            for t in task_templates
+            if isinstance(tid := t.get("task_id"), str) and (m := TASK_ID_RE.fullmatch(tid))
+        ),
+        default=0,
+    ) + 1
     return f"T{nxt:02d}"
 
 # 按鈕：呼叫 LLM → 產 JSON
 task_templates = st.session_state.get("task_templates")
 if task_templates is None:
     st.sidebar.info("Upload task.json first to use AI Helper.")
-if task_templates is not None and st.sidebar.button("Generate Task JSON"):
+generate_clicked = task_templates is not None and st.sidebar.button("Generate Task JSON")
+# Regenerate：已經有結果時，同一句描述不拿 cache 的舊答案，重新問一次
+regenerate_clicked = (
+    task_templates is not None
+    and st.session_state["ai_new_task"] is not None
+    and st.sidebar.button("Regenerate Task JSON")
+)
+if generate_clicked or regenerate_clicked:
     if not ai_text.strip():
         st.sidebar.warning("Please enter a task description.")
     else:
@@ -249,6 +373,7 @@ if task_templates is not None and st.sidebar.button("Generate Task JSON"):
                 existing_projects=existing_projects,
                 existing_task_titles=existing_titles,
                 existing_task_ids=existing_ids,
+                use_cache=not regenerate_clicked,
             )
             st.session_state["ai_new_task"] = new_task
             st.sidebar.success("Generated! Review the JSON below.")
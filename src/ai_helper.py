@@ -1,12 +1,153 @@
 from __future__ import annotations
 
-import json
-from typing import Dict, List, Any
-from openai import OpenAI
+import asyncio
+import hashlib
+import os
+import tempfile
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Optional
+import orjson
+from openai import AsyncOpenAI, OpenAI
+
+from src.engine import ALLOWED_ANCHORS, load_templates_from_obj
 
 
 client = OpenAI()
 
+MODEL = "gpt-4o-mini"
+MAX_CONCURRENT_REQUESTS = 8  # bulk checklist 同時最多送幾個，避免 429 rate limit
+CACHE_DIR = Path.home() / ".roadmap_cache"
+
+
+def _cache_key(system: Dict[str, str], user: str, temperature: float) -> str:
+    payload = {"model": MODEL, "sys": system["content"], "user": user, "t": temperature}
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _cache_read(key: str) -> bytes:
+    # miss 會 raise，lru_cache 不會記住 exception，寫入後下次就讀得到
+    return (CACHE_DIR / f"{key}.json").read_bytes()
+
+
+def _cache_get(key: str, is_valid: Callable[[Any], bool]) -> Optional[Any]:
+    try:
+        obj = orjson.loads(_cache_read(key))
+    except (OSError, ValueError):
+        return None
+    # 不合格的舊 cache 當作 miss，重新問一次
+    return obj if is_valid(obj) else None
+
+
+def _cache_put(key: str, obj: Any) -> None:
+    """
+    Write-through to ~/.roadmap_cache/<key>.json (atomic via os.replace).
+    Cache failures are never fatal; the AI result is still returned.
+    """
+    tmp = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(obj))
+        os.replace(tmp, CACHE_DIR / f"{key}.json")
+        tmp = None
+    except OSError:
+        pass
+    finally:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    # regenerate 會覆蓋同一個 key，記憶體裡的舊內容要丟掉
+    _cache_read.cache_clear()
+
+
+def _is_valid_task(obj: Any, existing_task_ids: List[str]) -> bool:
+    """
+    Same checks "Add to Template" applies to a new task: loadable fields,
+    allowed anchor, a new task_id, and depends_on only on existing ids.
+    """
+    if not isinstance(obj, dict):
+        return False
+    try:
+        (t,) = load_templates_from_obj([obj])
+    except (KeyError, TypeError, ValueError):
+        return False
+    ids = {i.strip() for i in existing_task_ids}
+    return t.anchor in ALLOWED_ANCHORS and t.task_id not in ids and all(d in ids for d in t.depends_on)
+
+
+def _is_valid_checklist(obj: Any) -> bool:
+    return (
+        isinstance(obj, dict)
+        and isinstance(obj.get("done_definition"), str)
+        and isinstance(obj.get("checklist"), list)
+        and isinstance(obj.get("risks"), list)
+    )
+
+
+def _chat_request(system: Dict[str, str], user: str, temperature: float) -> Dict[str, Any]:
+    return dict(
+        model=MODEL,
+        messages=[system, {"role": "user", "content": user}],
+        temperature=temperature,
+        # JSON mode: 保證回傳是合法 JSON object，不會有 markdown code fence
+        response_format={"type": "json_object"},
+    )
+
+
+def _parse_and_store(key: str, resp: Any, is_valid: Callable[[Any], bool]) -> Any:
+    content = resp.choices[0].message.content.strip()
+    result = orjson.loads(content)
+    # 只 cache 通過檢查的結果，不合格的下次還能重新產生
+    if is_valid(result):
+        _cache_put(key, result)
+    return result
+
+
+def _chat_json(
+    system: Dict[str, str],
+    user: str,
+    temperature: float,
+    is_valid: Callable[[Any], bool],
+    use_cache: bool = True,
+) -> Any:
+    """
+    Send one chat completion in JSON mode and parse the reply.
+    Identical (model, system, user, temperature) requests are served from the cache;
+    use_cache=False skips the lookup (regenerate) but still refreshes the entry.
+    """
+    key = _cache_key(system, user, temperature)
+    cached = _cache_get(key, is_valid) if use_cache else None
+    if cached is not None:
+        return cached
+
+    resp = client.chat.completions.create(**_chat_request(system, user, temperature))
+    return _parse_and_store(key, resp, is_valid)
+
+
+async def _chat_json_async(
+    aclient: AsyncOpenAI,
+    system: Dict[str, str],
+    user: str,
+    temperature: float,
+    is_valid: Callable[[Any], bool],
+    use_cache: bool = True,
+) -> Any:
+    """
+    Async version of _chat_json (same cache).
+    """
+    key = _cache_key(system, user, temperature)
+    cached = _cache_get(key, is_valid) if use_cache else None
+    if cached is not None:
+        return cached
+
+    resp = await aclient.chat.completions.create(**_chat_request(system, user, temperature))
+    return _parse_and_store(key, resp, is_valid)
+
 
 TASK_JSON_INSTRUCTIONS = """
 You are a strict JSON generator.
@@ -28,6 +169,9 @@ Rules:
 - Choose a sensible project from the list if user doesn't specify.
 """
 
+# system message 是常數，只建一次
+TASK_JSON_SYSTEM = {"role": "system", "content": TASK_JSON_INSTRUCTIONS}
+
 
 def generate_task_json(
     user_text: str,
@@ -35,9 +179,11 @@ def generate_task_json(
     existing_projects: List[str],
     existing_task_titles: List[str],
     existing_task_ids: List[str],
+    use_cache: bool = True,
 ) -> Dict:
     """
     Convert one-sentence description to a task JSON dict.
+    use_cache=False asks the model again even if a cached answer exists.
     """
     # Keep prompt small but grounded with your template context
     project_list = ", ".join(sorted(set(existing_projects))) if existing_projects else "Partner, Marketing, Event Execution, Landing Page, Others"
@@ -59,18 +205,14 @@ User request:
 """.strip()
 
     # Using Chat Completions works; Responses API is also available, but keep it simple.
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": TASK_JSON_INSTRUCTIONS},
-            {"role": "user", "content": msg},
-        ],
+    return _chat_json(
+        TASK_JSON_SYSTEM,
+        msg,
         temperature=0.2,
+        is_valid=partial(_is_valid_task, existing_task_ids=existing_task_ids),
+        use_cache=use_cache,
     )
 
-    content = resp.choices[0].message.content.strip()
-    return json.loads(content)
-
 CHECKLIST_INSTRUCTIONS = """
 You are an event-ops assistant.
 
@@ -84,15 +226,17 @@ Guidelines:
 - If the task is a milestone like "Host the event", include run-of-show + contingency items.
 """
 
-def generate_task_checklist(
+CHECKLIST_SYSTEM = {"role": "system", "content": CHECKLIST_INSTRUCTIONS}
+
+def _checklist_message(
     task_name: str,
     project: str,
     start_date: str,
     end_date: str,
     status: str,
     context_projects: list[str],
-) -> dict[str, Any]:
-    msg = f"""
+) -> str:
+    return f"""
 Task: {task_name}
 Project: {project}
 Status: {status}
@@ -102,15 +246,56 @@ End Date: {end_date}
 Other projects in this roadmap: {", ".join(context_projects)}
 """.strip()
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": CHECKLIST_INSTRUCTIONS},
-            {"role": "user", "content": msg},
-        ],
-        temperature=0.3,
-        # checklist 需要一點點發散，但仍要穩定、可執行。
+
+def generate_task_checklist(
+    task_name: str,
+    project: str,
+    start_date: str,
+    end_date: str,
+    status: str,
+    context_projects: list[str],
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    msg = _checklist_message(task_name, project, start_date, end_date, status, context_projects)
+
+    # checklist 需要一點點發散，但仍要穩定、可執行。
+    return _chat_json(
+        CHECKLIST_SYSTEM, msg, temperature=0.3, is_valid=_is_valid_checklist, use_cache=use_cache
     )
 
-    content = resp.choices[0].message.content.strip()
-    return json.loads(content)
+
+async def generate_task_checklist_async(
+    aclient: AsyncOpenAI,
+    task_name: str,
+    project: str,
+    start_date: str,
+    end_date: str,
+    status: str,
+    context_projects: list[str],
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    msg = _checklist_message(task_name, project, start_date, end_date, status, context_projects)
+    return await _chat_json_async(
+        aclient, CHECKLIST_SYSTEM, msg, temperature=0.3, is_valid=_is_valid_checklist, use_cache=use_cache
+    )
+
+
+async def generate_task_checklists_async(tasks: list[dict[str, Any]]) -> list[Any]:
+    """
+    tasks: list of generate_task_checklist kwargs.
+    Sends requests concurrently (at most MAX_CONCURRENT_REQUESTS in flight);
+    results keep the input order and a failed request comes back as its
+    exception instead of cancelling the others.
+    """
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def _one(aclient: AsyncOpenAI, kwargs: dict[str, Any]) -> dict[str, Any]:
+        async with sem:
+            return await generate_task_checklist_async(aclient, **kwargs)
+
+    # AsyncOpenAI 的連線綁定 event loop，每批用自己的 client
+    async with AsyncOpenAI() as aclient:
+        return await asyncio.gather(
+            *(_one(aclient, t) for t in tasks),
+            return_exceptions=True,
+        )
@@ -1,15 +1,19 @@
 import argparse
-import csv
-import json
+import heapq
 import sys
+from collections import Counter
 from dataclasses import dataclass
-from datetime import date, datetime, timedelta
+from functools import lru_cache
+from datetime import date, datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple, Any
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
+
+import numpy as np
+import orjson
 
 ALLOWED_ANCHORS = {"event_date", "director_start_date"}
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TaskTemplate:
     task_id: str
     task: str
@@ -17,18 +21,31 @@ class TaskTemplate:
     anchor: str  # "event_date" | "director_start_date"
     end_offset_days: int
     duration_days: int
-    depends_on: List[str]
+    depends_on: Tuple[str, ...]
     default_status: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ScheduledTask:
     task_id: str
     task: str
     project: str
     status: str
-    start_date: date
-    end_date: date
+    start_ord: int  # date.toordinal()
+    end_ord: int
+
+
+@dataclass(slots=True)
+class TemplateArrays:
+    """
+    Struct-of-arrays view of templates (same row order), used by the vectorized scheduler.
+    deps[i] holds the row indices that row i depends on.
+    """
+    task_id: List[str]
+    offset: np.ndarray
+    duration: np.ndarray
+    anchor_is_event: np.ndarray
+    deps: List[Tuple[int, ...]]
 
 def load_templates_from_obj(raw):
     """
@@ -49,7 +66,7 @@ def load_templates_from_obj(raw):
             anchor=str(obj["anchor"]).strip(),
             end_offset_days=int(obj["end_offset_days"]),
             duration_days=int(obj["duration_days"]),
-            depends_on=[str(d).strip() for d in obj.get("depends_on", [])],
+            depends_on=tuple(str(d).strip() for d in obj.get("depends_on", [])),
             default_status=str(obj["default_status"]).strip(),
         ))
 
@@ -57,7 +74,7 @@ def load_templates_from_obj(raw):
 
 def load_templates(path: Path) -> List[TaskTemplate]:
     try:
-        raw = json.loads(path.read_text(encoding="utf-8"))
+        raw = orjson.loads(path.read_bytes())
     except Exception as e:
         raise ValueError(f"Failed to read/parse JSON from {path}: {e}")
 
@@ -105,7 +122,7 @@ def load_templates(path: Path) -> List[TaskTemplate]:
                 anchor=anchor,
                 end_offset_days=end_offset_days,
                 duration_days=duration_days,
-                depends_on=[d.strip() for d in depends_on if d.strip()],
+                depends_on=tuple(d.strip() for d in depends_on if d.strip()),
                 default_status=default_status,
             )
         )
@@ -115,9 +132,9 @@ def load_templates(path: Path) -> List[TaskTemplate]:
 
 def validate_templates(templates: List[TaskTemplate]) -> None:
     ids = [t.task_id for t in templates]
-    dupes = {x for x in ids if ids.count(x) > 1}
+    dupes = sorted(x for x, n in Counter(ids).items() if n > 1)
     if dupes:
-        raise ValueError(f"Duplicate task_id(s) found: {sorted(dupes)}")
+        raise ValueError(f"Duplicate task_id(s) found: {dupes}")
 
     id_set = set(ids)
     missing_deps = []
@@ -142,18 +159,18 @@ def topo_sort(templates: List[TaskTemplate]) -> List[str]:
             graph[dep].append(t.task_id)  # dep -> t
             indeg[t.task_id] += 1
 
+    # min-heap keeps the same lexicographic tie-breaking without re-sorting
     queue = [tid for tid, deg in indeg.items() if deg == 0]
-    queue.sort()
+    heapq.heapify(queue)
 
     order: List[str] = []
     while queue:
-        cur = queue.pop(0)
+        cur = heapq.heappop(queue)
         order.append(cur)
         for nxt in graph[cur]:
             indeg[nxt] -= 1
             if indeg[nxt] == 0:
-                queue.append(nxt)
-                queue.sort()
+                heapq.heappush(queue, nxt)
 
     if len(order) != len(templates):
         # cycle exists; find nodes still with indegree > 0
@@ -163,74 +180,154 @@ def topo_sort(templates: List[TaskTemplate]) -> List[str]:
     return order
 
 
+def to_arrays(templates: List[TaskTemplate]) -> TemplateArrays:
+    pos = {t.task_id: i for i, t in enumerate(templates)}
+    return TemplateArrays(
+        task_id=[t.task_id for t in templates],
+        offset=np.array([t.end_offset_days for t in templates], dtype=np.int64),
+        duration=np.array([t.duration_days for t in templates], dtype=np.int64),
+        anchor_is_event=np.array([t.anchor == "event_date" for t in templates], dtype=np.bool_),
+        deps=[tuple(pos[d] for d in t.depends_on) for t in templates],
+    )
+
+
 def initial_schedule(
-    templates_by_id: Dict[str, TaskTemplate],
-    event_date: date,
-    director_start_date: date,
-) -> Dict[str, ScheduledTask]:
-    out: Dict[str, ScheduledTask] = {}
-    for tid, t in templates_by_id.items():
-        anchor_date = event_date if t.anchor == "event_date" else director_start_date
-        end_date = anchor_date + timedelta(days=t.end_offset_days)
-        start_date = end_date - timedelta(days=t.duration_days - 1)
-        out[tid] = ScheduledTask(
-            task_id=tid,
-            task=t.task,
-            project=t.project,
-            status=t.default_status,
-            start_date=start_date,
-            end_date=end_date,
-        )
-    return out
+    arrays: TemplateArrays,
+    event_ord: int,
+    director_ord: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    event_ord / director_ord: anchor dates as date.toordinal()
+    Returns (start, end) as int64 day ordinals, aligned with `arrays`.
+    """
+    anchor_days = np.where(arrays.anchor_is_event, event_ord, director_ord).astype(np.int64)
+    end = anchor_days + arrays.offset
+    start = end - (arrays.duration - 1)
+    return start, end
+
+
+def dependency_layers(arrays: TemplateArrays) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    arrays: rows must already be in topological order.
+    Groups (child_idx, parent_idx) edges by dependency depth, so every
+    parent is final before its layer is shifted.
+    """
+    depth = [0] * len(arrays.deps)
+    edges: Dict[int, Tuple[List[int], List[int]]] = {}
+
+    for i, parents in enumerate(arrays.deps):
+        if not parents:
+            continue
+        depth[i] = 1 + max(depth[p] for p in parents)
+        children, pars = edges.setdefault(depth[i], ([], []))
+        children.extend([i] * len(parents))
+        pars.extend(parents)
+
+    return [
+        (np.array(children, dtype=np.int64), np.array(pars, dtype=np.int64))
+        for _, (children, pars) in sorted(edges.items())
+    ]
 
 
 def apply_dependency_shifts(
-    order: List[str],
-    templates_by_id: Dict[str, TaskTemplate],
-    scheduled: Dict[str, ScheduledTask],
+    layers: List[Tuple[np.ndarray, np.ndarray]],
+    start: np.ndarray,
+    end: np.ndarray,
 ) -> None:
     """
     Enforce: task.start_date >= max(dep.end_date) for all deps.
     If violated, shift the task window forward by the needed delta.
+    Updates `start` / `end` in place, one layer at a time.
     """
-    for tid in order:
-        t = templates_by_id[tid]
-        if not t.depends_on:
-            continue
-        latest_dep_end = max(scheduled[d].end_date for d in t.depends_on)
-        if scheduled[tid].start_date < latest_dep_end:
-            delta = latest_dep_end - scheduled[tid].start_date
-            scheduled[tid].start_date += delta
-            scheduled[tid].end_date += delta
+    latest = np.empty_like(end)
+    for child, parent in layers:
+        latest[child] = np.iinfo(np.int64).min
+        np.maximum.at(latest, child, end[parent])
+        delta = np.maximum(latest[child] - start[child], 0)
+        # a child appears once per dependency, but its delta is identical each time
+        start[child] += delta
+        end[child] += delta
 
 
 def clamp_to_director_start(
-    scheduled: Dict[str, ScheduledTask],
-    director_start_date: date,
+    start: np.ndarray,
+    end: np.ndarray,
+    director_ord: int,
 ) -> None:
     """
     Optional: ensure no task starts before director_start_date.
     Shifts any early task forward so start_date == director_start_date.
     """
-    for tid, st in scheduled.items():
-        if st.start_date < director_start_date:
-            delta = director_start_date - st.start_date
-            st.start_date += delta
-            st.end_date += delta
+    delta = np.maximum(director_ord - start, 0)
+    start += delta
+    end += delta
+
+
+ScheduleFn = Callable[[int, int, bool], Tuple[np.ndarray, np.ndarray]]
+
+
+def compile_schedule(templates: List[TaskTemplate]) -> ScheduleFn:
+    """
+    templates: validated and in topological order.
+    Anchor mask, offsets, durations and dependency layers depend only on the
+    template, so build them once and return a closure that only needs the two
+    anchor ordinals: run(event_ord, director_ord, clamp) -> (start, end).
+    """
+    arrays = to_arrays(templates)
+    layers = dependency_layers(arrays)
+
+    def _run(event_ord: int, director_ord: int, clamp: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = initial_schedule(arrays, event_ord, director_ord)
+        apply_dependency_shifts(layers, start, end)
+        if clamp:
+            clamp_to_director_start(start, end, director_ord)
+            # clamp may re-break dependencies in edge cases, so enforce again
+            apply_dependency_shifts(layers, start, end)
+        return start, end
+
+    return _run
+
+
+@lru_cache(maxsize=32)
+def _compile_from_json(raw_json: bytes) -> Tuple[List[TaskTemplate], ScheduleFn]:
+    """
+    Keyed by the canonical JSON bytes of the template, so the same task.json
+    is parsed, validated and topo-sorted only once across date changes.
+    Invalid templates raise and are not cached.
+    """
+    # 1) Parse/load raw_tasks into TaskTemplate objects (pure parsing)
+    templates = load_templates_from_obj(orjson.loads(raw_json))
+
+    # 2) Validate templates (duplicate ids, bad anchors, missing deps, etc.)
+    validate_templates(templates)
+
+    # 3) Build helper maps + topological ordering (dependency-aware ordering)
+    templates_by_id = {t.task_id: t for t in templates}
+    order = topo_sort(templates)  # list of task_id in dependency order
+    ordered = [templates_by_id[tid] for tid in order]
+
+    return ordered, compile_schedule(ordered)
 
 def write_csv(path: Path, tasks: List[ScheduledTask]) -> None:
+    # 只有這裡用到 pandas，import 放裡面，CLI 不用付 pandas 的 import 成本
+    import pandas as pd
+
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["Task", "Project", "Status", "Start Date", "End Date"])
-        for t in tasks:
-            w.writerow([
+    df = pd.DataFrame(
+        [
+            (
                 t.task,
                 t.project,
                 t.status,
-                t.start_date.isoformat(),
-                t.end_date.isoformat(),
-            ])
+                date.fromordinal(t.start_ord).isoformat(),
+                date.fromordinal(t.end_ord).isoformat(),
+            )
+            for t in tasks
+        ],
+        columns=["Task", "Project", "Status", "Start Date", "End Date"],
+    )
+    # 跟原本 csv.writer 一樣用 \r\n
+    df.to_csv(path, index=False, lineterminator="\r\n")
 
 def generate_roadmap_rows(
     raw_tasks: Any,
@@ -252,46 +349,21 @@ def generate_roadmap_rows(
       Task, Project, Status, Start Date, End Date
     """
 
-    # 1) Parse/load raw_tasks into TaskTemplate objects (pure parsing)
-    templates = load_templates_from_obj(raw_tasks)
-
-    # 2) Validate templates (duplicate ids, bad anchors, missing deps, etc.)
-    validate_templates(templates)
-
-    # 3) Build helper maps + topological ordering (dependency-aware ordering)
-    templates_by_id = {t.task_id: t for t in templates}
-    order = topo_sort(templates)  # list of task_id in dependency order
-
-    # 4) Initial schedule (compute start/end from anchor + offsets + duration)
-    scheduled = initial_schedule(
-        templates_by_id=templates_by_id,
-        event_date=event_date,
-        director_start_date=director_start_date,
-    )
-
-    # 5) Enforce dependency time constraints by shifting tasks forward if needed
-    apply_dependency_shifts(
-        order=order,
-        templates_by_id=templates_by_id,
-        scheduled=scheduled,
-    )
+    # 1-3) Parse, validate, topo-sort and compile (cached per template content)
+    ordered, run = _compile_from_json(orjson.dumps(raw_tasks, option=orjson.OPT_SORT_KEYS))
 
-    # 6) Optional clamp to director start (useful if you don't want tasks before start date)
-    if clamp:
-        clamp_to_director_start(scheduled, director_start_date)
-        # clamp may re-break dependencies in edge cases, so enforce again
-        apply_dependency_shifts(order, templates_by_id, scheduled)
+    # 4-6) Initial schedule, dependency shifts and optional clamp to director start
+    start, end = run(event_date.toordinal(), director_start_date.toordinal(), clamp)
 
-    # 7) Convert ScheduledTask objects into rows with the 5 columns (strings)
+    # 7) Convert day ordinals back into rows with the 5 columns (strings)
     rows = []
-    for tid in order:
-        st = scheduled[tid]
+    for t, s, e in zip(ordered, start.tolist(), end.tolist()):
         rows.append({
-            "Task": st.task,
-            "Project": st.project,
-            "Status": st.status,
-            "Start Date": st.start_date.isoformat(),
-            "End Date": st.end_date.isoformat(),
+            "Task": t.task,
+            "Project": t.project,
+            "Status": t.default_status,
+            "Start Date": date.fromordinal(s).isoformat(),
+            "End Date": date.fromordinal(e).isoformat(),
         })
 
     # 8) Optional sorting for UI convenience (does NOT change dates, only ordering)
@@ -1,10 +1,11 @@
 # generate.py
 import argparse
-import json
 from datetime import datetime
 from pathlib import Path
 import csv
 
+import orjson
+
 from src.engine import generate_roadmap_rows
 
 
@@ -21,8 +22,8 @@ def main():
     ap.add_argument("--clamp", action="store_true")
     args = ap.parse_args()
 
-    with open(args.tasks, "r", encoding="utf-8") as f:
-        raw_tasks = json.load(f)
+    with open(args.tasks, "rb") as f:
+        raw_tasks = orjson.loads(f.read())
 
     rows = generate_roadmap_rows(
         raw_tasks=raw_tasks,